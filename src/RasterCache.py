@@ -0,0 +1,181 @@
+import hashlib
+import os
+import tempfile
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+
+from Shapes import Shape, Line, Polygon
+from config import canvas_width, canvas_height
+
+# Increase whenever the rasterization or the file format changes, so that old entries aren't used anymore
+cache_version = 1
+# After exceeding the maximum size, entries are removed until the cache is this much of the maximum size
+# (prevents a cleanup on every write)
+eviction_target = 0.9
+# Entries are marked as recently used at most once per this many seconds (saves a write on every read)
+touch_interval = 60
+# Temporary files older than this many seconds were left behind by a crashed process
+stale_temp_age = 60 * 60
+
+
+class RasterCache:
+    """
+    Stores the rasterized pixels (outline and fill) of shapes on disk so they can be reused across sessions.
+    Least recently used entries are removed when the cache grows too large.
+    Entries are written atomically, so several processes can share the same cache directory.
+    """
+
+    def __init__(self, directory: str, max_size: int):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(self.directory, exist_ok=True)
+        self.remove_stale_temp_files()
+        self.size = sum(size for _, _, size in self.get_entries())
+
+    def get_key(self, shape: Shape, bezier_segments: int) -> str:
+        """
+        Gets a stable hash of everything the rasterization of a (screen space) line or polygon depends on
+        """
+        if isinstance(shape, Line):
+            lines, closed = [shape], False
+        elif isinstance(shape, Polygon):
+            lines, closed = shape.get_lines(), shape.closed
+        else:
+            raise ValueError(f"Shapes of type {type(shape).__name__} can't be cached")
+
+        data = [cache_version, type(shape).__name__, closed, bezier_segments, canvas_width, canvas_height]
+        for l in lines:
+            data.append([(c.x, c.y) for c in l.get_control_points()])
+        return hashlib.sha256(repr(data).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Gets the outline and fill pixels stored for a key (or None if there is no valid entry)
+        """
+        path = self.get_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+                last_used = os.fstat(f.fileno()).st_mtime
+            # Mark the entry as recently used
+            if time.time() - last_used > touch_interval:
+                os.utime(path)
+            return self.decode(data)
+        except (OSError, ValueError):
+            # Missing (or removed by another process in the meantime) and broken entries are treated as misses
+            return None
+
+    def put(self, key: str, outline: np.ndarray, fill: np.ndarray):
+        """
+        Stores the outline and fill pixels of a shape
+        """
+        data = self.encode(outline, fill)
+        try:
+            # Write to a temporary file first, other processes should never see a partially written entry
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(temp_path, self.get_path(key))
+            except OSError:
+                os.remove(temp_path)
+                raise
+        except OSError:
+            # The cache is only an optimization, drawing continues without it
+            return
+
+        self.size += len(data)
+        if self.size > self.max_size:
+            try:
+                self.evict()
+            except OSError:
+                # Another process or the user may have removed or locked the directory, try again on the next write
+                pass
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache is below its size limit
+        """
+        self.remove_stale_temp_files()
+
+        # Other processes may have added or removed entries, so the directory is the source of truth
+        entries = sorted(self.get_entries(), key=lambda e: e[1])
+        self.size = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if self.size <= self.max_size * eviction_target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # Already removed by another process or locked, the next eviction takes care of it
+                pass
+            self.size -= size
+
+    def remove_stale_temp_files(self):
+        """
+        Removes temporary files that were never turned into entries because their process crashed
+        """
+        now = time.time()
+        for e in os.scandir(self.directory):
+            if e.name.endswith(".tmp"):
+                try:
+                    if now - e.stat().st_mtime > stale_temp_age:
+                        os.remove(e.path)
+                except OSError:
+                    pass
+
+    def get_entries(self):
+        """
+        Gets the path, last usage time and size of all entries
+        """
+        entries = []
+        for e in os.scandir(self.directory):
+            if e.name.endswith(".bin"):
+                try:
+                    stat = e.stat()
+                except OSError:
+                    continue
+                entries.append((e.path, stat.st_mtime, stat.st_size))
+        return entries
+
+    def get_path(self, key: str) -> str:
+        """
+        Gets the path of the file that stores an entry
+        """
+        return os.path.join(self.directory, f"{key}.bin")
+
+    def encode(self, outline: np.ndarray, fill: np.ndarray) -> bytes:
+        """
+        Packs the pixels within the bounding box of the shape into bits.
+        Format: x, y, width and height of the bounding box (uint32), followed by the outline and fill bits
+        """
+        pixels = np.argwhere(outline | fill)
+        if len(pixels) == 0:
+            x, y, width, height = 0, 0, 0, 0
+        else:
+            (x, y), (max_x, max_y) = pixels.min(axis=0), pixels.max(axis=0)
+            width, height = max_x - x + 1, max_y - y + 1
+
+        header = np.array([x, y, width, height], dtype=np.uint32)
+        bits = np.packbits(np.stack((outline[x:x + width, y:y + height], fill[x:x + width, y:y + height])))
+        return header.tobytes() + bits.tobytes()
+
+    def decode(self, data: bytes) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Unpacks the outline and fill pixels of an entry (see encode)
+        """
+        x, y, width, height = (int(v) for v in np.frombuffer(data[:16], dtype=np.uint32))
+        if x + width > canvas_width or y + height > canvas_height:
+            raise ValueError("Cache entry doesn't fit on the canvas")
+        if len(data) != 16 + (2 * width * height + 7) // 8:
+            raise ValueError("Cache entry is incomplete")
+        bits = np.unpackbits(np.frombuffer(data[16:], dtype=np.uint8), count=2 * width * height)
+        bits = bits.reshape((2, width, height)).astype(bool)
+
+        outline = np.zeros((canvas_width, canvas_height), dtype=bool)
+        fill = np.zeros((canvas_width, canvas_height), dtype=bool)
+        outline[x:x + width, y:y + height] = bits[0]
+        fill[x:x + width, y:y + height] = bits[1]
+        return outline, fill
@@ -5,8 +5,10 @@ from typing import List, Tuple
 import numpy as np
 
 from Patterns import stripe_mask_v, stripe_mask_h, stripe_mask_c
-from Shapes import Line, Shape, Polygon, Point, ControlPoint
-from config import bezier_segments, canvas_width, canvas_height
+from RasterCache import RasterCache
+from Shapes import Line, Shape, Polygon, Point, ControlPoint, get_min_max_points
+from Viewport import Viewport
+from config import canvas_width, canvas_height, raster_cache_dir, raster_cache_size
 
 # This is necessary for floodfill to work
 sys.setrecursionlimit(100000)
@@ -21,23 +23,38 @@ class Renderer:
         self.canvas = canvas
         self.show_control_points = True
         self.cache: List[Shape] = None
-
-    def render(self, shapes: List[Shape], color: str, pattern: str):
+        self.viewport = Viewport()
+        self.raster_cache = None
+        if raster_cache_dir:
+            try:
+                self.raster_cache = RasterCache(raster_cache_dir, raster_cache_size)
+            except OSError:
+                # The cache is only an optimization, drawing works without it
+                pass
+
+    def render(self, shapes: List[Shape], bounding_boxes: np.ndarray, color: str, pattern: str,
+               preview_shapes: List[Shape] = None, cacheable=True):
         """
-        Renders all provided shapes on the tk canvas
+        Renders all provided shapes on the tk canvas.
+        Shapes are ordered by z-index and come with their bounding boxes (see ShapeManager.get_shape_index),
+        preview shapes (the shape the user is drawing right now) are drawn on top.
+        Only cacheable renders add new shapes to the raster cache, preview shapes are never added.
         """
         self.canvas.delete("all")
 
-        # Order by z-index
-        # https://www.perplexity.ai/search/8bbd5f6e-4a1d-48ee-ab76-4ff9ba2534c6?s=c
-        shapes.sort(key=lambda x: x.z_index)
+        # Skip shapes outside the visible area
+        visible_shapes = [(shapes[i], cacheable) for i in np.flatnonzero(self.viewport.get_visible(bounding_boxes))]
+        visible_shapes += [(s, False) for s in preview_shapes or [] if self.viewport.is_visible(s)]
 
         # Draw shapes
-        for s in shapes:
+        for s, cache_shape in visible_shapes:
+            # Convert to screen space
+            s = self.viewport.to_screen_shape(s)
+
             if isinstance(s, Line):
-                self.draw_bezier(s)
+                self.draw_bezier(s, cache_shape)
             elif isinstance(s, Polygon):
-                self.draw_polygon(s, color, pattern)
+                self.draw_polygon(s, color, pattern, cache_shape)
             elif isinstance(s, ControlPoint):
                 self.draw_control_point(s)
 
@@ -51,53 +68,162 @@ class Renderer:
         """
         self.show_control_points = not self.show_control_points
 
-    def draw_line(self, line: Line):
+    def rasterize(self, shape: Shape, cacheable=True) -> Tuple[np.ndarray, np.ndarray]:
         """
-        Draws a line with the bresenham algorithm and returns the pixels to set
+        Gets the outline and fill pixels of a line or polygon, from the raster cache if it was rasterized before.
+        New results are only stored in the cache if the shape is cacheable
+        """
+        key = None
+        if self.raster_cache:
+            key = self.raster_cache.get_key(shape, self.viewport.get_bezier_segments())
+            cached = self.raster_cache.get(key)
+            if cached is not None:
+                return cached
+
+        outline = np.zeros((canvas_width, canvas_height), dtype=bool)
+        fill = np.zeros((canvas_width, canvas_height), dtype=bool)
+        if isinstance(shape, Polygon):
+            for l in shape.get_lines():
+                self.rasterize_bezier(l, outline)
+            if shape.closed:
+                fill = self.fill_polygon(shape, outline)
+        else:
+            self.rasterize_bezier(shape, outline)
+
+        if key and cacheable:
+            self.raster_cache.put(key, outline, fill)
+        return outline, fill
+
+    def draw_pixels(self, pixels, color="black", bounding_box: Tuple[Point, Point] = None):
+        """
+        Sets all selected pixels on the tk canvas.
+        If the pixels are known to be inside a bounding box, only this part of the canvas is searched
         """
-        pixels = np.zeros((canvas_width, canvas_height), dtype=bool)
-        pixels_to_draw = np.array(list(self.bresenham(line.p1.x, line.p1.y, line.p3.x, line.p3.y)), dtype=tuple)
+        offset = (0, 0)
+        if bounding_box:
+            start, end = bounding_box
+            offset = (max(start.x, 0), max(start.y, 0))
+            pixels = pixels[offset[0]:end.x + 1, offset[1]:end.y + 1]
+
+        for x, y in np.argwhere(pixels) + offset:
+            self.canvas.create_rectangle(x, y, x, y, outline=color)
+
+    def rasterize_line(self, line: Line, pixels=None):
+        """
+        Sets the pixels of a line with the bresenham algorithm (in a new array if none is given) and returns them
+        """
+        if pixels is None:
+            pixels = np.zeros((canvas_width, canvas_height), dtype=bool)
+
+        # Only the part of the line on the canvas has to be walked (matters when zoomed in)
+        clipped = self.clip_line(line.p1.x, line.p1.y, line.p3.x, line.p3.y)
+        if clipped is None:
+            return pixels
+
+        pixels_to_draw = np.array(list(self.bresenham(*clipped)), dtype=tuple)
         for p in pixels_to_draw:
             if 0 < p[0] < canvas_width and 0 < p[1] < canvas_height:
-                self.canvas.create_rectangle(p[0], p[1], p[0], p[1])
                 pixels[p[0], p[1]] = True
 
         return pixels
 
-    def draw_bezier(self, line: Line):
+    def clip_line(self, x0, y0, x1, y1):
         """
-        Draws a quadratic Bézier curve with de casteljau algorithm
+        Clips a line to the drawable part of the canvas and returns the new end points (None if it's outside)
+        Liang-Barsky algorithm based on https://en.wikipedia.org/wiki/Liang%E2%80%93Barsky_algorithm
         """
-        points = []
-        for t in range(bezier_segments + 1):
-            points.append(self.de_casteljau([line.p1, line.p2, line.p3], 1 / bezier_segments * t))
+        dx = x1 - x0
+        dy = y1 - y0
+        t0, t1 = 0, 1
+        # Pixels at 0 aren't drawn (see rasterize_line)
+        for p, q in ((-dx, x0 - 1), (dx, canvas_width - 1 - x0), (-dy, y0 - 1), (dy, canvas_height - 1 - y0)):
+            if p == 0:
+                if q < 0:
+                    return None
+            elif p < 0:
+                t0 = max(t0, q / p)
+            else:
+                t1 = min(t1, q / p)
+        if t0 > t1:
+            return None
+
+        # Lines on the canvas keep their exact end points
+        if t0 == 0 and t1 == 1:
+            return x0, y0, x1, y1
+        return round(x0 + t0 * dx), round(y0 + t0 * dy), round(x0 + t1 * dx), round(y0 + t1 * dy)
+
+    def draw_line(self, line: Line):
+        """
+        Draws a line with the bresenham algorithm and returns the pixels to set
+        """
+        pixels = self.rasterize_line(line)
+        self.draw_pixels(pixels, bounding_box=get_min_max_points([line.p1, line.p3]))
+        return pixels
 
-        # Draw lines to connect these points
-        pixels = np.zeros((canvas_width, canvas_height), dtype=bool)
+    def rasterize_bezier(self, line: Line, pixels=None):
+        """
+        Sets the pixels of a quadratic Bézier curve with de casteljau algorithm (in a new array if none is given)
+        and returns them
+        """
+        if pixels is None:
+            pixels = np.zeros((canvas_width, canvas_height), dtype=bool)
+        points = self.get_bezier_points(line)
+
+        # Connect these points with lines
         for i in range(len(points) - 1):
             # https://www.perplexity.ai/search/cf60ad1e-3454-4b35-94da-c3975269a871?s=c
-            pixels |= self.draw_line(Line(points[i], points[i + 1]))
+            self.rasterize_line(Line(points[i], points[i + 1]), pixels)
+        return pixels
+
+    def draw_bezier(self, line: Line, cacheable=True):
+        """
+        Draws a quadratic Bézier curve and returns the pixels to set
+        """
+        pixels, _ = self.rasterize(line, cacheable)
+        self.draw_pixels(pixels, bounding_box=line.get_bounding_box_points())
         return pixels
 
-    def draw_polygon(self, polygon: Polygon, color, pattern):
+    def get_bezier_points(self, line: Line) -> List[Point]:
+        """
+        Gets the points that split a quadratic Bézier curve into straight lines (more segments when zoomed in)
+        """
+        segments = self.viewport.get_bezier_segments()
+        points = []
+        for t in range(segments + 1):
+            points.append(self.de_casteljau([line.p1, line.p2, line.p3], 1 / segments * t))
+        return points
+
+    def draw_polygon(self, polygon: Polygon, color, pattern, cacheable=True):
         """
         Draws a polygon and fills it if it's a closed shape
         """
-        lines = polygon.get_lines()
-        pixels = np.zeros((canvas_width, canvas_height), dtype=bool)
-        for l in lines:
-            pixels |= self.draw_bezier(l)
+        pixels, fill = self.rasterize(polygon, cacheable)
 
         if polygon.closed:
-            self.fill_polygon(polygon, pixels, color, pattern)
-            # Bug: Tkinter pixel drawn via create_rect != a real pixel but larger. To prevent lines from disappearing
-            # we have to ensure that they are drawn last, otherwise fill overlap the pixels
-            for x, y in np.argwhere(pixels):
-                self.canvas.create_rectangle(x, y, x, y)
+            self.draw_fill(fill, color, pattern)
+        # Bug: Tkinter pixel drawn via create_rect != a real pixel but larger. To prevent lines from disappearing
+        # we have to ensure that they are drawn last, otherwise fill overlap the pixels
+        self.draw_pixels(pixels, bounding_box=polygon.get_bounding_box_points())
+
+    def draw_fill(self, fill, color: str, pattern: str):
+        """
+        Sets the pixels inside a polygon with the color and pattern
+        """
+        if pattern == "horizontal":
+            mask = fill * stripe_mask_h
+        elif pattern == "vertical":
+            mask = fill * stripe_mask_v
+        elif pattern == "checkers":
+            mask = fill * stripe_mask_c
+        else:
+            mask = fill.astype(int)
 
-    def fill_polygon(self, polygon: Polygon, line_pixels, color: str, pattern: str):
+        for x, y in np.argwhere(mask > 0):
+            self.canvas.create_rectangle(x, y, x, y, outline=color if mask[x, y] == 1 else "white")
+
+    def fill_polygon(self, polygon: Polygon, line_pixels):
         """
-        Fills a polygon by reversing the flood fill algorith
+        Gets the pixels inside a polygon by reversing the flood fill algorith
         """
         #  Get the bounding box + small padding to fill
         start, end = polygon.get_bounding_box_points()
@@ -106,28 +232,57 @@ class Renderer:
         end.x += 1;
         end.y += 1;
 
-        mask = np.ones((canvas_width, canvas_height), dtype=bool)
-        mask[start.x:end.x, start.y:end.y] = False
-        edited = np.zeros((canvas_width, canvas_height), dtype=bool)
+        if start.x < 0 or start.y < 0 or end.x >= canvas_width or end.y >= canvas_height:
+            # The outline of a partially visible polygon is cut off at the canvas border, so the flood fill
+            # could leak into the polygon. Test the visible pixels with the even-odd rule instead
+            mask = self.even_odd_mask(polygon)
+        else:
+            mask = np.ones((canvas_width, canvas_height), dtype=bool)
+            mask[start.x:end.x, start.y:end.y] = False
+            edited = np.zeros((canvas_width, canvas_height), dtype=bool)
 
-        # Mask everything around the polygon
-        mask = self.flood_fill((start.x, start.y), line_pixels, start, end, mask, edited)
-        # Reverse the mask (so that only the insides of the polygon are selected)
-        mask = np.invert(mask)
+            # Mask everything around the polygon
+            mask = self.flood_fill((start.x, start.y), line_pixels, start, end, mask, edited)
+            # Reverse the mask (so that only the insides of the polygon are selected)
+            mask = np.invert(mask)
 
-        if pattern == "horizontal":
-            mask = mask * stripe_mask_h
-        elif pattern == "vertical":
-            mask = mask * stripe_mask_v
-        elif pattern == "checkers":
-            mask = mask * stripe_mask_c
-        else:
-            mask = mask.astype(int)
+        # Only the pixels inside the bounding box that don't belong to the outline
+        bounding_box = np.zeros((canvas_width, canvas_height), dtype=bool)
+        bounding_box[max(start.x, 0):end.x + 1, max(start.y, 0):end.y + 1] = True
+        return mask & bounding_box & ~line_pixels
+
+    def even_odd_mask(self, polygon: Polygon):
+        """
+        Selects all canvas pixels inside the polygon with the even-odd rule
+        Based on https://wrfranklin.org/Research/Short_Notes/pnpoly.html
+        """
+        mask = np.zeros((canvas_width, canvas_height), dtype=bool)
+        start, end = polygon.get_bounding_box_points()
+        min_x, min_y = max(start.x, 0), max(start.y, 0)
+        max_x, max_y = min(end.x, canvas_width - 1), min(end.y, canvas_height - 1)
+        if min_x > max_x or min_y > max_y:
+            return mask
 
-        # Fill everything inside the polygon by setting the pixels
-        for x, y in np.argwhere((mask == 1) | (mask == 2)):
-            if start.x <= x <= end.x and start.y <= y <= end.y and not line_pixels[x, y]:
-                self.canvas.create_rectangle(x, y, x, y, outline=color if mask[x, y] == 1 else "white")
+        # Straight edges (x1, y1, x2, y2) of the polygon, tessellated the same way as the drawn outline
+        edges = []
+        for l in polygon.get_lines():
+            points = self.get_bezier_points(l)
+            for i in range(len(points) - 1):
+                edges.append((points[i].x, points[i].y, points[i + 1].x, points[i + 1].y))
+        x1, y1, x2, y2 = np.array(edges, dtype=float).T
+
+        # Count the edges crossed by a ray from every pixel to the right, one row of pixels at a time
+        xs = np.arange(min_x, max_x + 1)
+        for y in range(min_y, max_y + 1):
+            spans_y = (y1 > y) != (y2 > y)
+            if not spans_y.any():
+                continue
+            intersection_x = x1[spans_y] + (y - y1[spans_y]) * (x2[spans_y] - x1[spans_y]) / (
+                    y2[spans_y] - y1[spans_y])
+            crossings = np.count_nonzero(xs[:, None] < intersection_x, axis=1)
+            mask[min_x:max_x + 1, y] = crossings % 2 == 1
+
+        return mask
 
     def flood_fill(self, point: Tuple[int, int], line_pixels, start: Point, end: Point, mask, edited):
         """
@@ -1,8 +1,13 @@
 import math
-from typing import List
+from typing import List, Optional
+
+import numpy as np
 
 from Shapes import Shape, Point, Line, Polygon
-from config import control_point_size, canvas_width, canvas_height
+from config import bezier_segments, control_point_size
+
+# Number of points that are tested against all polygon bounding boxes at once in batch queries
+query_chunk_size = 1024
 
 
 class ShapeManager:
@@ -12,6 +17,34 @@ class ShapeManager:
 
     def __init__(self):
         self.shapes: List[Shape] = []
+        # Tessellated edges (n x 4 array of x1, y1, x2, y2) per closed polygon, used for containment queries
+        self.edge_cache = {}
+        # All shapes in z-order, their bounding boxes (n x 4 array of min x, min y, max x, max y) and their rows
+        self.shape_index = None
+        # Closed polygons in z-order and their rows in the shape index
+        self.polygon_index = None
+        # Bounding boxes of the closed polygons and their order by left edge (change whenever a shape moves)
+        self.polygon_bounds = None
+        self.polygon_order = None
+
+    def __getstate__(self):
+        # The caches are derived data and are rebuilt on demand, so they are not saved with the drawing
+        state = self.__dict__.copy()
+        state["edge_cache"] = {}
+        state["shape_index"] = None
+        state["polygon_index"] = None
+        state["polygon_bounds"] = None
+        state["polygon_order"] = None
+        return state
+
+    def __setstate__(self, state):
+        # Drawings saved before the caches existed don't contain them
+        state.setdefault("edge_cache", {})
+        state.setdefault("shape_index", None)
+        state.setdefault("polygon_index", None)
+        state.setdefault("polygon_bounds", None)
+        state.setdefault("polygon_order", None)
+        self.__dict__.update(state)
 
     def add_shape(self, shape):
         """
@@ -20,11 +53,27 @@ class ShapeManager:
         shape.z_index = len(self.shapes)
         self.shapes.append(shape)
 
+        # The new shape has the highest z-index, so it's appended to the indexes instead of rebuilding them
+        if self.shape_index is not None:
+            shapes, bounding_boxes, rows = self.shape_index
+            rows[shape] = len(shapes)
+            shapes.append(shape)
+            self.shape_index = (shapes, np.vstack((bounding_boxes, self.get_bounding_box(shape))), rows)
+            if self.polygon_index is not None and isinstance(shape, Polygon) and shape.closed:
+                polygons, polygon_rows = self.polygon_index
+                polygons.append(shape)
+                self.polygon_index = (polygons, np.append(polygon_rows, rows[shape]))
+        self.invalidate_polygon_bounds()
+
     def clear(self):
         """
         Clears all shapes
         """
         self.shapes.clear()
+        self.edge_cache.clear()
+        self.shape_index = None
+        self.polygon_index = None
+        self.invalidate_polygon_bounds()
 
     def get_shapes(self):
         """
@@ -32,13 +81,21 @@ class ShapeManager:
         """
         return self.shapes
 
-    def get_shape_by_click(self, click_point: Point):
+    def get_shape_by_click(self, click_point: Point, tolerance=control_point_size):
         """
-        Add a shape to the collection and sets z-index based on position
+        Gets the id of the control point under the click. The tolerance is given in document units
         """
-        for s in self.shapes:
+        shapes, bounding_boxes, _ = self.get_shape_index()
+        # Bounding box prefilter: only shapes whose bounding box (grown by the tolerance) contains the click
+        candidates = ((bounding_boxes[:, 0] - tolerance < click_point.x) &
+                      (click_point.x < bounding_boxes[:, 2] + tolerance) &
+                      (bounding_boxes[:, 1] - tolerance < click_point.y) &
+                      (click_point.y < bounding_boxes[:, 3] + tolerance))
+
+        for i in np.flatnonzero(candidates):
+            s = shapes[i]
             for c in s.get_control_points():
-                if abs(c.x - click_point.x) < control_point_size and abs(c.y - click_point.y) < control_point_size:
+                if abs(c.x - click_point.x) < tolerance and abs(c.y - click_point.y) < tolerance:
                     if isinstance(s, Line):
                         if c == s.p2:
                             s.is_bezier = True
@@ -48,10 +105,6 @@ class ShapeManager:
         """
         Moves a point to a new position and updates all connected lines
         """
-        # Don't move points outside the canvas
-        if not (0 < new_point_pos.x < canvas_width) or not (0 < new_point_pos.y < canvas_height):
-            return
-
         # Find all lines connected to the control point (more than one is possible)
         for s in self.shapes:
             old_point_pos = None
@@ -81,9 +134,234 @@ class ShapeManager:
                 old_point_pos.y = new_point_pos.y
             for l in lines_to_readjust:
                 l.center_control_point()
+            if old_point_pos:
+                # The geometry of the shape changed, so its edges and bounding box have to be recomputed
+                self.edge_cache.pop(s, None)
+                self.update_bounding_box(s)
+
+    def move_shape(self, shape: Shape, delta_x, delta_y):
+        """
+        Moves all points of a shape by the given distance
+        """
+        lines = shape.get_lines() if isinstance(shape, Polygon) else [shape] if isinstance(shape, Line) else []
+        # Default control points have to stay centered (see move_point)
+        lines_to_readjust = [l for l in lines if l.has_centered_control_point()]
+
+        for c in shape.get_control_points():
+            c.x += delta_x
+            c.y += delta_y
+        for l in lines_to_readjust:
+            l.center_control_point()
+
+        self.edge_cache.pop(shape, None)
+        self.update_bounding_box(shape)
 
     def distance_between(self, p1: Point, p2: Point):
         """
         Euclidean distance between two points based on https://en.wikipedia.org/wiki/Euclidean_distance
         """
         return math.sqrt((p2.x - p1.x) ** 2 + (p2.y - p1.y) ** 2)
+
+    def get_polygon_at(self, point: Point) -> Optional[Polygon]:
+        """
+        Gets the top-most closed polygon whose interior contains the point (or None)
+        """
+        return self.get_polygons_at([point])[0]
+
+    def get_polygons_at(self, points: List[Point]) -> List[Optional[Polygon]]:
+        """
+        Gets the top-most closed polygon containing each of the points (or None for points outside all polygons)
+        """
+        polygons, bounding_boxes = self.get_polygon_index()
+        result = [None] * len(points)
+        if not polygons or not points:
+            return result
+
+        xy = np.array([(p.x, p.y) for p in points], dtype=float)
+        # Row of the top-most polygon containing each point (-1 = none)
+        top_rows = np.full(len(points), -1)
+
+        # Polygons sorted by their left edge: only polygons whose left edge lies within the widest bounding box
+        # to the left of a point can contain it
+        order, sorted_min_x, max_width = self.get_polygon_order()
+
+        # Points are processed in chunks to limit the number of candidate pairs in memory
+        for chunk_start in range(0, len(points), query_chunk_size):
+            chunk = xy[chunk_start:chunk_start + query_chunk_size]
+
+            # Bounding box prefilter: pairs of polygon and point rows
+            first = np.searchsorted(sorted_min_x, chunk[:, 0] - max_width, side="left")
+            counts = np.searchsorted(sorted_min_x, chunk[:, 0], side="right") - first
+            point_rows = np.repeat(np.arange(len(chunk)), counts)
+            polygon_rows = order[self.expand_ranges(first, counts)]
+            boxes, candidates = bounding_boxes[polygon_rows], chunk[point_rows]
+            inside_box = ((boxes[:, 0] <= candidates[:, 0]) & (candidates[:, 0] <= boxes[:, 2]) &
+                          (boxes[:, 1] <= candidates[:, 1]) & (candidates[:, 1] <= boxes[:, 3]))
+            polygon_rows, point_rows = polygon_rows[inside_box], point_rows[inside_box] + chunk_start
+            if len(polygon_rows) == 0:
+                continue
+
+            # Edges of all candidate polygons in one array
+            candidate_rows, pair_polygons = np.unique(polygon_rows, return_inverse=True)
+            polygon_edges = [self.get_polygon_edges(polygons[i]) for i in candidate_rows]
+            edge_counts = np.array([len(e) for e in polygon_edges])
+            edges = np.concatenate(polygon_edges)
+            edge_offsets = np.cumsum(edge_counts) - edge_counts
+
+            # Every pair is tested against all edges of its polygon at once
+            pair_edge_counts = edge_counts[pair_polygons]
+            edge_pairs = np.repeat(np.arange(len(polygon_rows)), pair_edge_counts)
+            edge_rows = self.expand_ranges(edge_offsets[pair_polygons], pair_edge_counts)
+            crossings = self.crosses_ray(xy[point_rows[edge_pairs]], edges[edge_rows])
+            inside = np.bincount(edge_pairs, weights=crossings, minlength=len(polygon_rows)) % 2 == 1
+
+            # The polygon with the highest row (z-index) wins
+            np.maximum.at(top_rows, point_rows[inside], polygon_rows[inside])
+
+        return [polygons[i] if i >= 0 else None for i in top_rows]
+
+    def expand_ranges(self, starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        """
+        Concatenates the ranges starts[i] ... starts[i] + counts[i] - 1 into one array
+        """
+        ends = np.cumsum(counts)
+        return np.arange(ends[-1] if len(ends) else 0) - np.repeat(ends - counts - starts, counts)
+
+    def get_polygons_in_rectangle(self, start: Point, end: Point) -> List[Polygon]:
+        """
+        Gets all closed polygons that touch the rectangle spanned by two opposite corners (ordered by z-index)
+        """
+        polygons, bounding_boxes = self.get_polygon_index()
+        if not polygons:
+            return []
+
+        min_x, max_x = min(start.x, end.x), max(start.x, end.x)
+        min_y, max_y = min(start.y, end.y), max(start.y, end.y)
+        corners = np.array([(min_x, min_y), (max_x, min_y), (max_x, max_y), (min_x, max_y)], dtype=float)
+
+        # Bounding box prefilter: only polygons whose bounding box overlaps the rectangle
+        overlapping = ((bounding_boxes[:, 0] <= max_x) & (min_x <= bounding_boxes[:, 2]) &
+                       (bounding_boxes[:, 1] <= max_y) & (min_y <= bounding_boxes[:, 3]))
+
+        result = []
+        for i in np.flatnonzero(overlapping):
+            edges = self.get_polygon_edges(polygons[i])
+            x1, y1, x2, y2 = edges[:, 0, None], edges[:, 1, None], edges[:, 2, None], edges[:, 3, None]
+
+            # Separating axis test of every edge against the rectangle: the edge crosses the rectangle if their
+            # bounding boxes overlap and the rectangle's corners aren't all on the same side of the edge
+            boxes_overlap = ((np.minimum(x1, x2) <= max_x) & (min_x <= np.maximum(x1, x2)) &
+                             (np.minimum(y1, y2) <= max_y) & (min_y <= np.maximum(y1, y2)))[:, 0]
+            sides = (x2 - x1) * (corners[:, 1] - y1) - (y2 - y1) * (corners[:, 0] - x1)
+            edges_crossing = boxes_overlap & ~(sides > 0).all(axis=1) & ~(sides < 0).all(axis=1)
+
+            # Either the outline runs through the rectangle or the rectangle lies inside the polygon
+            if edges_crossing.any() or self.contains_points(polygons[i], corners[:1]).any():
+                result.append(polygons[i])
+        return result
+
+    def contains_points(self, polygon: Polygon, points: np.ndarray) -> np.ndarray:
+        """
+        Tests which of the points (n x 2 array) lie inside the polygon with the even-odd rule
+        Based on https://wrfranklin.org/Research/Short_Notes/pnpoly.html
+        """
+        edges = self.get_polygon_edges(polygon)
+        crossings = self.crosses_ray(points[:, None, :], edges[None, :, :])
+        return np.count_nonzero(crossings, axis=1) % 2 == 1
+
+    def crosses_ray(self, points: np.ndarray, edges: np.ndarray) -> np.ndarray:
+        """
+        Tests whether the horizontal ray from each point to the right crosses the edge (x1, y1, x2, y2) at the
+        same position (arrays are broadcast against each other)
+        """
+        x, y = points[..., 0], points[..., 1]
+        x1, y1, x2, y2 = edges[..., 0], edges[..., 1], edges[..., 2], edges[..., 3]
+
+        # An edge is crossed if it spans the point's y coordinate and the intersection lies to the right of the point
+        spans_y = (y1 > y) != (y2 > y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            intersection_x = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+        return spans_y & (x < intersection_x)
+
+    def get_polygon_edges(self, polygon: Polygon) -> np.ndarray:
+        """
+        Gets the straight edges (n x 4 array of x1, y1, x2, y2) that approximate the Bézier lines of a polygon
+        """
+        edges = self.edge_cache.get(polygon)
+        if edges is None:
+            # Same tessellation as the renderer at zoom level 1 (bezier_segments straight lines per line)
+            t = np.linspace(0, 1, bezier_segments + 1)[:, None]
+            # Control points of all lines (lines x 3 x 2), every curve evaluated at all t at once (lines x t x 2)
+            controls = np.array([[(c.x, c.y) for c in l.get_control_points()] for l in polygon.get_lines()],
+                                dtype=float).reshape(-1, 3, 2)
+            curves = ((1 - t) ** 2 * controls[:, None, 0] + 2 * (1 - t) * t * controls[:, None, 1] +
+                      t ** 2 * controls[:, None, 2])
+            edges = np.concatenate((curves[:, :-1], curves[:, 1:]), axis=2).reshape(-1, 4)
+            self.edge_cache[polygon] = edges
+        return edges
+
+    def get_polygon_index(self):
+        """
+        Gets all closed polygons ordered by z-index along with their bounding boxes
+        """
+        shapes, bounding_boxes, _ = self.get_shape_index()
+        if self.polygon_index is None:
+            rows = [i for i, s in enumerate(shapes) if isinstance(s, Polygon) and s.closed]
+            self.polygon_index = ([shapes[i] for i in rows], np.array(rows, dtype=int))
+        polygons, rows = self.polygon_index
+        if self.polygon_bounds is None:
+            self.polygon_bounds = bounding_boxes[rows]
+        return polygons, self.polygon_bounds
+
+    def get_polygon_order(self):
+        """
+        Gets the rows of the closed polygons sorted by the left edge of their bounding boxes, the sorted left edges
+        and the width of the widest bounding box
+        """
+        if self.polygon_order is None:
+            _, bounding_boxes = self.get_polygon_index()
+            order = np.argsort(bounding_boxes[:, 0], kind="stable")
+            max_width = np.max(bounding_boxes[:, 2] - bounding_boxes[:, 0]) if len(order) else 0
+            self.polygon_order = (order, bounding_boxes[order, 0], max_width)
+        return self.polygon_order
+
+    def invalidate_polygon_bounds(self):
+        """
+        Drops the cached polygon bounding boxes after shapes were added or moved
+        """
+        self.polygon_bounds = None
+        self.polygon_order = None
+
+    def get_shape_index(self):
+        """
+        Gets all shapes ordered by z-index along with their bounding boxes (NaN for shapes without points)
+        and a lookup of their rows
+        """
+        if self.shape_index is None:
+            shapes = sorted(self.shapes, key=lambda s: s.z_index)
+            bounding_boxes = np.full((len(shapes), 4), np.nan)
+            rows = {}
+            for i, s in enumerate(shapes):
+                rows[s] = i
+                bounding_boxes[i] = self.get_bounding_box(s)
+            self.shape_index = (shapes, bounding_boxes, rows)
+        return self.shape_index
+
+    def update_bounding_box(self, shape: Shape):
+        """
+        Updates the bounding box of a shape whose points have moved
+        """
+        if self.shape_index is not None:
+            _, bounding_boxes, rows = self.shape_index
+            if shape in rows:
+                bounding_boxes[rows[shape]] = self.get_bounding_box(shape)
+                self.invalidate_polygon_bounds()
+
+    def get_bounding_box(self, shape: Shape):
+        """
+        Gets the bounding box of a shape as min x, min y, max x, max y (NaN for shapes without points)
+        """
+        start, end = shape.get_bounding_box_points()
+        if start.x is None:
+            return np.nan, np.nan, np.nan, np.nan
+        return start.x, start.y, end.x, end.y
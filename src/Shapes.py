@@ -62,26 +62,36 @@ class Line(Shape):
         self.p1: Point = start
         self.p3: Point = end
         # Control point for quadratic bezier curve
-        self.p2: Point = Point((self.p1.x + self.p3.x) // 2, (self.p1.y + self.p3.y) // 2)
+        self.p2: Point = Point(*self.get_center())
 
     def get_control_points(self):
         return [self.p1, self.p2, self.p3]
 
     def get_bounding_box_points(self) -> Tuple[Point, Point]:
-        return get_min_max_points([self.p1, self.p3])
+        # A Bézier curve never leaves the convex hull of its control points, so p2 has to be included
+        return get_min_max_points([self.p1, self.p2, self.p3])
 
     def has_centered_control_point(self):
         """
         Checks whether the in-between control point is centered
         If it's not, it means that the user touched it and the line is a Bézier curve
         """
-        return self.p2.x == (self.p1.x + self.p3.x) // 2 and self.p2.y == (self.p1.y + self.p3.y) // 2
+        return (self.p2.x, self.p2.y) == self.get_center()
 
     def center_control_point(self):
         """
         Centers the in-between control point of the line
         """
-        self.p2 = Point((self.p1.x + self.p3.x) // 2, (self.p1.y + self.p3.y) // 2)
+        self.p2 = Point(*self.get_center())
+
+    def get_center(self) -> Tuple[float, float]:
+        """
+        Gets the position halfway between start and end point.
+        Lines with integer points (e.g. drawings saved before zooming existed) keep integer control points
+        """
+        if all(isinstance(v, int) for v in (self.p1.x, self.p1.y, self.p3.x, self.p3.y)):
+            return (self.p1.x + self.p3.x) // 2, (self.p1.y + self.p3.y) // 2
+        return (self.p1.x + self.p3.x) / 2, (self.p1.y + self.p3.y) / 2
 
 
 class ControlPoint(Shape):
@@ -127,12 +137,9 @@ class Polygon(Shape):
         return self.lines
 
     def get_control_points(self):
-        result = []
-        for l in self.lines:
-            for c in l.get_control_points():
-                if c not in result:
-                    result.append(c)
-        return result
+        # Lines share their end points, every point should only be returned once (dict keeps the order)
+        return list(dict.fromkeys(c for l in self.lines for c in l.get_control_points()))
 
     def get_bounding_box_points(self) -> Tuple[Point, Point]:
-        return get_min_max_points(self.get_control_points())
+        # Shared points don't have to be removed for the bounding box (get_control_points does that in O(n²))
+        return get_min_max_points([c for l in self.lines for c in l.get_control_points()])
@@ -7,7 +7,7 @@ from typing import List
 from Renderer import Renderer
 from ShapeManager import ShapeManager
 from Shapes import Point, ControlPoint, Line, Polygon, Shape
-from config import control_point_size, canvas_width, canvas_height
+from config import control_point_size, canvas_width, canvas_height, zoom_step, pan_step, settle_delay
 
 
 class Ui:
@@ -15,6 +15,11 @@ class Ui:
     Handles the user input and commands and routes them to the renderer
     """
     grabbed_point: Point = None
+    grabbed_polygon: Polygon = None
+    # Last document position of the cursor while a polygon is dragged
+    grab_position: Point = None
+    # Pending render after zooming or panning (see schedule_settled_render)
+    settle_job = None
     renderer: Renderer
     shape_manager: ShapeManager
 
@@ -102,9 +107,19 @@ class Ui:
         canvas.bind("<ButtonPress-3>", self.add_point)
         canvas.bind("<ButtonRelease-1>", self.stop_draw)
 
+        # Viewport (mouse wheel is <MouseWheel> on Windows / macOS and <Button-4/5> on Linux)
+        canvas.bind("<MouseWheel>", self.zoom)
+        canvas.bind("<Button-4>", self.zoom)
+        canvas.bind("<Button-5>", self.zoom)
+        self.root.bind("<Left>", lambda event: self.pan(-pan_step, 0))
+        self.root.bind("<Right>", lambda event: self.pan(pan_step, 0))
+        self.root.bind("<Up>", lambda event: self.pan(0, -pan_step))
+        self.root.bind("<Down>", lambda event: self.pan(0, pan_step))
+
         # Keyboard
         self.root.bind("c", self.show_control_points)
         self.root.bind("x", self.clear_canvas)
+        self.root.bind("v", self.reset_viewport)
 
     def show_control_points(self, event):
         """
@@ -113,25 +128,93 @@ class Ui:
         self.renderer.toggle_control_points()
         self.render()
 
+    def zoom(self, event):
+        """
+        Zooms in or out at the position of the cursor
+        """
+        zoom_in = event.num == 4 or getattr(event, "delta", 0) > 0
+        self.renderer.viewport.zoom_at(Point(event.x, event.y), zoom_step if zoom_in else 1 / zoom_step)
+        # The raster cache is keyed by screen coordinates, intermediate zoom levels are rarely seen again
+        self.render(cacheable=False)
+        self.schedule_settled_render()
+
+    def pan(self, delta_x, delta_y):
+        """
+        Moves the visible area of the drawing by a distance in screen pixels
+        """
+        self.renderer.viewport.pan(delta_x, delta_y)
+        self.render(cacheable=False)
+        self.schedule_settled_render()
+
+    def schedule_settled_render(self):
+        """
+        Renders again once the user stopped zooming or panning for a moment, so the final view gets cached
+        """
+        if self.settle_job:
+            self.root.after_cancel(self.settle_job)
+        self.settle_job = self.root.after(settle_delay, self.settled_render)
+
+    def settled_render(self):
+        """
+        Renders the view that the user settled on (see schedule_settled_render)
+        """
+        self.settle_job = None
+        self.render()
+
+    def reset_viewport(self, event):
+        """
+        Resets zoom and pan
+        """
+        self.renderer.viewport.reset()
+        self.render()
+
+    def get_document_point(self, event) -> Point:
+        """
+        Converts the position of a mouse event from screen space to document space
+        """
+        return self.renderer.viewport.to_document(Point(event.x, event.y))
+
     def grab_point(self, event):
         """
         Selects the point under the user's cursor.
         """
-        self.grabbed_point = self.shape_manager.get_shape_by_click(Point(event.x, event.y))
+        # Control points have the same size on screen regardless of the zoom level
+        tolerance = control_point_size / self.renderer.viewport.zoom
+        position = self.get_document_point(event)
+        self.grabbed_point = self.shape_manager.get_shape_by_click(position, tolerance)
+        if not self.grabbed_point:
+            # No control point under the cursor, grab the whole polygon instead
+            self.grabbed_polygon = self.shape_manager.get_polygon_at(position)
+            self.grab_position = position
 
     def move_point(self, event):
         """
         Moves the grabbed point to the desired location.
         """
+        # Don't move points outside the canvas
+        if not (0 < event.x < canvas_width) or not (0 < event.y < canvas_height):
+            return
+
         if self.grabbed_point:
-            self.shape_manager.move_point(self.grabbed_point, Point(event.x, event.y))
-            self.render()
+            self.shape_manager.move_point(self.grabbed_point, self.get_document_point(event))
+            # Intermediate positions while dragging aren't worth caching
+            self.render(cacheable=False)
+        elif self.grabbed_polygon:
+            position = self.get_document_point(event)
+            self.shape_manager.move_shape(self.grabbed_polygon, position.x - self.grab_position.x,
+                                          position.y - self.grab_position.y)
+            self.grab_position = position
+            self.render(cacheable=False)
 
     def drop_point(self, event):
         """
         Ends the process of moving the point around.
         """
+        if self.grabbed_point or self.grabbed_polygon:
+            # Render once more to cache the final position
+            self.render()
         self.grabbed_point = None
+        self.grabbed_polygon = None
 
     new_shape_points = []
 
@@ -141,15 +224,16 @@ class Ui:
         """
         global new_shape_points
         new_shape_points = []
-        new_shape_points.append(Point(event.x, event.y))
+        new_shape_points.append(self.get_document_point(event))
         # Temporary show the shape which is being drawn by the user
-        self.render(self.shape_manager.get_shapes() + [ControlPoint(new_shape_points[0])])
+        self.render([ControlPoint(new_shape_points[0])])
 
     def has_minimum_distance_to_last_point(self, point: Point):
         """
         Don't allow user to draw points on top of each other (bad UX)
         """
-        line_length = self.shape_manager.distance_between(new_shape_points[-1], point)
+        # Measured on screen, because control points have the same size on screen regardless of the zoom level
+        line_length = self.shape_manager.distance_between(new_shape_points[-1], point) * self.renderer.viewport.zoom
         control_point_diagonal = math.sqrt(2 * (control_point_size ** 2))
         # At least 3 control points should fit on a line (because control points shouldn't overlap)
         return line_length >= control_point_diagonal * 3
@@ -163,20 +247,21 @@ class Ui:
         # Only if drawing is in progress
         # https://www.perplexity.ai/search/1c73ef15-23b2-4936-a4db-6294e63533e0?s=c
         if "new_shape_points" in globals() and len(new_shape_points) > 0:
-            new_point = Point(event.x, event.y)
+            new_point = self.get_document_point(event)
             if self.has_minimum_distance_to_last_point(new_point):
                 new_shape_points.append(new_point)
             # Temporary show the shape which is being drawn by the user
-            self.render(self.shape_manager.get_shapes() + [Polygon(new_shape_points, closed=False, z_index=1000)])
+            self.render([Polygon(new_shape_points, closed=False, z_index=1000)])
 
     def stop_draw(self, event):
         """
         Combine the points to a shape. This results in a single point (1) or line / polygon (>1).
         """
         global new_shape_points
-        new_point = Point(event.x, event.y)
+        new_point = self.get_document_point(event)
 
         distance_to_origin = self.shape_manager.distance_between(new_shape_points[0], new_point)
+        distance_to_origin *= self.renderer.viewport.zoom
         if distance_to_origin < control_point_size * 2:
             # Closed shape (filled polygon)
             if len(new_shape_points) == 1:
@@ -216,6 +301,8 @@ class Ui:
         if f is not None:
             self.shape_manager = pickle.load(f)
             f.close()
+            # Start at the default view, which is also the one most likely to be in the raster cache
+            self.renderer.viewport.reset()
             self.render()
 
     def clear_canvas(self, event):
@@ -225,9 +312,11 @@ class Ui:
         self.shape_manager.clear()
         self.render()
 
-    def render(self, shapes: List[Shape] = None):
+    def render(self, preview_shapes: List[Shape] = None, cacheable=True):
         """
-        Renders all existing shapes
+        Renders all existing shapes and the shapes that are being drawn by the user.
+        Interactive updates (dragging, zooming) set cacheable to False so they don't fill up the raster cache
         """
-        self.renderer.render(self.shape_manager.get_shapes() if not shapes else shapes, self.color_selection.get(),
-                             self.pattern_selection.get())
+        shapes, bounding_boxes, _ = self.shape_manager.get_shape_index()
+        self.renderer.render(shapes, bounding_boxes, self.color_selection.get(), self.pattern_selection.get(),
+                             preview_shapes, cacheable)
@@ -0,0 +1,110 @@
+from typing import Tuple
+
+import numpy as np
+
+from Shapes import Shape, Point, Line, Polygon, ControlPoint
+from config import bezier_segments, canvas_width, canvas_height, min_zoom, max_zoom
+
+
+class Viewport:
+    """
+    Transforms between document space (where shapes live) and screen space (pixels on the canvas)
+    """
+
+    def __init__(self):
+        self.zoom = 1.0
+        # Document coordinates of the upper left corner of the canvas
+        self.x = 0.0
+        self.y = 0.0
+
+    def reset(self):
+        """
+        Resets zoom and pan
+        """
+        self.zoom = 1.0
+        self.x = 0.0
+        self.y = 0.0
+
+    def pan(self, delta_x, delta_y):
+        """
+        Moves the viewport by a distance given in screen pixels
+        """
+        self.x += delta_x / self.zoom
+        self.y += delta_y / self.zoom
+
+    def zoom_at(self, screen_point: Point, factor: float):
+        """
+        Zooms in (factor > 1) or out (factor < 1) while keeping the document point under the cursor in place
+        """
+        document_x = screen_point.x / self.zoom + self.x
+        document_y = screen_point.y / self.zoom + self.y
+        self.zoom = min(max(self.zoom * factor, min_zoom), max_zoom)
+        self.x = document_x - screen_point.x / self.zoom
+        self.y = document_y - screen_point.y / self.zoom
+
+    def to_screen(self, p: Point) -> Point:
+        """
+        Converts a point from document space to screen space
+        """
+        return Point(round((p.x - self.x) * self.zoom), round((p.y - self.y) * self.zoom))
+
+    def to_document(self, p: Point) -> Point:
+        """
+        Converts a point from screen space to document space
+        """
+        # Not rounded, so that points can be placed more precisely when zoomed in (to_screen rounds for drawing)
+        return Point(p.x / self.zoom + self.x, p.y / self.zoom + self.y)
+
+    def get_bounding_box_points(self) -> Tuple[Point, Point]:
+        """
+        Gets the upper left and bottom right point of the visible area in document space
+        """
+        return Point(self.x, self.y), Point(self.x + canvas_width / self.zoom, self.y + canvas_height / self.zoom)
+
+    def is_visible(self, shape: Shape) -> bool:
+        """
+        Checks whether the bounding box of a shape intersects the visible area
+        """
+        start, end = shape.get_bounding_box_points()
+        # Shapes without points (e.g. a polygon with a single point) have no bounding box and nothing to draw
+        if start.x is None:
+            return False
+        view_start, view_end = self.get_bounding_box_points()
+        return start.x <= view_end.x and view_start.x <= end.x and start.y <= view_end.y and view_start.y <= end.y
+
+    def get_visible(self, bounding_boxes: np.ndarray) -> np.ndarray:
+        """
+        Checks which bounding boxes (n x 4 array of min x, min y, max x, max y) intersect the visible area
+        """
+        view_start, view_end = self.get_bounding_box_points()
+        return ((bounding_boxes[:, 0] <= view_end.x) & (view_start.x <= bounding_boxes[:, 2]) &
+                (bounding_boxes[:, 1] <= view_end.y) & (view_start.y <= bounding_boxes[:, 3]))
+
+    def get_bezier_segments(self) -> int:
+        """
+        Gets the number of segments per Bézier curve for the current zoom level (more details when zoomed in)
+        """
+        return max(1, round(bezier_segments * self.zoom))
+
+    def to_screen_shape(self, shape: Shape) -> Shape:
+        """
+        Creates a copy of a shape with all control points converted to screen space
+        """
+        if not shape.get_control_points():
+            return shape
+        if isinstance(shape, Line):
+            result = Line(self.to_screen(shape.p1), self.to_screen(shape.p3))
+            result.p2 = self.to_screen(shape.p2)
+        elif isinstance(shape, Polygon):
+            points = [self.to_screen(l.p1) for l in shape.lines]
+            if not shape.closed:
+                points.append(self.to_screen(shape.lines[-1].p3))
+            result = Polygon(points, closed=shape.closed)
+            for screen_line, line in zip(result.lines, shape.lines):
+                screen_line.p2 = self.to_screen(line.p2)
+        elif isinstance(shape, ControlPoint):
+            result = ControlPoint(self.to_screen(shape.p))
+        else:
+            return shape
+        result.z_index = shape.z_index
+        return result
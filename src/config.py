@@ -1,3 +1,5 @@
+import os
+
 # Controls how many segments a bezier curve should have
 # = how many straight lines to use to construct a bezier curve
 # needs to be >= 1
@@ -7,7 +9,21 @@ bezier_segments = 10
 canvas_width = 500
 canvas_height = 500
 
+# Limits and step of the viewport zoom (1 = one document unit per screen pixel)
+min_zoom = 0.1
+max_zoom = 8
+zoom_step = 1.25
+# Distance in px that the viewport moves per arrow key press
+pan_step = 50
+# Time in ms without zooming or panning after which the view is rendered again to fill the raster cache
+settle_delay = 500
+
 # Width of the stripes in the fill patterns
 stripe_width = 4
 # Size of the control points (handles)
 control_point_size = 5
+
+# Directory of the on-disk cache for rasterized shapes (reused across sessions), None disables the cache
+raster_cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "minidraw")
+# Maximum size of the raster cache in bytes, least recently used shapes are removed first
+raster_cache_size = 100 * 1024 * 1024